@@ -1,3 +1,9 @@
-from .basemodel import BaseModel, u, BaseParameters
-
 __version__ = '2022.12.6'
+
+
+def __getattr__(name):
+    # The model classes need cmf and spotpy, which are only imported on first use
+    if name in ('BaseModel', 'u', 'BaseParameters'):
+        from . import basemodel
+        return getattr(basemodel, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,50 +1,140 @@
 #!/usr/bin/env python3
 
+import argparse
+import inspect
+import re
 import sys
 
 
+_commands = None
+_parser = None
+
+
 def get_commands():
     """
     Gets a dictionary of allowed commands
     """
+    global _commands
+    if _commands is None:
+        from . import commands
+        _commands = {
+            n: f
+            for n, f in vars(commands).items()
+            if not n.startswith('_')
+        }
+    return _commands
+
+
+def _str2bool(value: str) -> bool:
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def _add_command(subparsers, name, f):
+    """
+    Adds a subparser for the command function f, using its signature for the arguments.
+    Like in a Python call, a parameter can be given by position or by name (--name=value
+    or name=value). Parameters behind *args can only be given by name
+    """
+    doc = inspect.getdoc(f) or ''
+    sp = subparsers.add_parser(
+        name, help=doc.split('\n', 1)[0], description=doc,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sp.set_defaults(cmd=f)
+    for p in inspect.signature(f).parameters.values():
+        option = '--' + p.name.replace('_', '-')
+        if p.kind is p.VAR_POSITIONAL:
+            sp.add_argument(p.name, nargs='+')
+        elif p.kind is p.VAR_KEYWORD:
+            continue
+        elif isinstance(p.default, bool):
+            sp.add_argument(option, dest=p.name, nargs='?', const=True, type=_str2bool,
+                            default=argparse.SUPPRESS)
+        else:
+            kwargs = dict(default=argparse.SUPPRESS)
+            if p.default not in (p.empty, None):
+                kwargs['type'] = type(p.default)
+            if p.kind is p.POSITIONAL_OR_KEYWORD:
+                # A missing required parameter is reported by _parse_args
+                sp.add_argument(p.name, nargs='?', **kwargs)
+                if p.default is p.empty:
+                    # The usage shows the positional form of a required parameter only
+                    kwargs['help'] = argparse.SUPPRESS
+            elif p.default is p.empty:
+                kwargs['required'] = True
+            sp.add_argument(option, dest=p.name, metavar=p.name.upper(), **kwargs)
+
+
+def _build_parser():
+    """
+    Creates the argument parser with a subparser for each command
+    """
+    global _parser
+    if _parser is None:
+        _parser = argparse.ArgumentParser(
+            prog='cmf.lumped',
+            description='Runs a custom build lumped cmf model'
+        )
+        subparsers = _parser.add_subparsers(dest='command', metavar='command')
+        subparsers.required = True
+        for name, f in get_commands().items():
+            _add_command(subparsers, name, f)
+    return _parser
+
 
-    from . import commands
-    return {
-        n: f
-        for n, f in vars(commands).items()
-        if not n.startswith('_')
-    }
+def _normalize_argv(argv):
+    """
+    Translates the old style arguments key=value to --key=value and
+    <command> ... help to <command> ... --help
+    """
+    return [
+        '--help' if arg == 'help' and i else
+        re.sub(r'^-*(\w+)=', lambda m: '--' + m.group(1).lower().replace('_', '-') + '=', arg)
+        for i, arg in enumerate(argv)
+    ]
 
 
-def main(*args, **kwargs):
+def _parse_args(argv):
+    """
+    Parses the command line arguments and returns the command function with its arguments
 
-    if not (args or kwargs):
-        # if no args or kwargs are given, parse them from sys.argv
-        # allowed usage: cmf.lumped <command> model.py value1 param2=value2 --param3=value3
-        args = []
-        kwargs = {}
-        for arg in sys.argv[1:]:
-            if '=' in arg:
-                k, v = arg.strip().lstrip('-').split('=', 1)
-                kwargs[k.lower()] = v
-            else:
-                args.append(arg)
+    >>> f, args, kwargs = _parse_args(['run', 'model.py', '1000', 'lhs'])
+    >>> f.__name__, args, kwargs
+    ('run', [], {'model': 'model.py', 'runs': '1000', 'sampler': 'lhs'})
+    >>> _parse_args(['run', 'model.py', 'runs=1000', '--sampler=lhs'])[2]
+    {'model': 'model.py', 'runs': '1000', 'sampler': 'lhs'}
+    >>> _parse_args(['descr', 'model=model.py'])[2]
+    {'model': 'model.py'}
+    >>> _parse_args(['doc', 'model1.py', 'model2.py', 'in_browser=yes'])[1:]
+    (['model1.py', 'model2.py'], {'in_browser': True})
+    """
+    parser = _build_parser()
+    ns = parser.parse_args(_normalize_argv(argv))
+    f = ns.cmd
+    kwargs = {k: v for k, v in vars(ns).items() if k not in ('cmd', 'command')}
+    args = []
+    missing = []
+    for p in inspect.signature(f).parameters.values():
+        if p.kind is p.VAR_POSITIONAL:
+            args.extend(kwargs.pop(p.name, []))
+        elif p.kind is p.POSITIONAL_OR_KEYWORD and p.default is p.empty and p.name not in kwargs:
+            missing.append(p.name)
+    if missing:
+        parser.error(f'{ns.command}: the following arguments are required: ' + ', '.join(missing))
+    return f, args, kwargs
 
-    commands = get_commands()
 
-    # If still no args or kwargs or first arg is no command
-    if not (args or kwargs) or args[0] not in commands:
-        cmd_list = '|'.join(commands)
-        sys.stderr.write(f'Usage: cmf.lumped [{cmd_list}] path/to/model.py')
-        exit(1)
-    f = commands[args.pop(0)]
+def main(argv=None):
+    """
+    Parses the command line and calls the command
 
-    if 'help' in args or 'help' in kwargs:
-        sys.stderr.write(f.__doc__)
-    else:
-        f(*args, **kwargs)
+    allowed usage: cmf.lumped <command> model.py value1 param2=value2 --param3=value3
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    f, args, kwargs = _parse_args(argv)
+    return f(*args, **kwargs)
 
 
 if __name__ == '__main__':
     main()
-
@@ -13,54 +13,13 @@ import spotpy
 from spotpy.parameter import Uniform, Constant
 import numpy as np
 import datetime
-import importlib.util
 import os
+import pickle
 import sys
+from collections import OrderedDict
 from .dataprovider import DataProvider
 from .doctools import DocClass
-
-def load_module_from_path(path_to_module:str):
-    """
-    Loads a module from a path
-    :param path_to_module:
-    :return:
-
-    See: https://docs.python.org/3/library/importlib.html#importing-a-source-file-directly
-    """
-    name = os.path.basename(path_to_module).replace('.py', '')
-    spec = importlib.util.spec_from_file_location(name, path_to_module)
-    module = importlib.util.module_from_spec(spec)
-    sys.modules[name] = module
-    spec.loader.exec_module(module)
-
-    return module
-
-
-def get_model_class(path_to_module:str, classname=None):
-    """
-    This function get the class of a lumped cmf model from
-    a Python file
-    :param path_to_module: The file path to the module
-    :param classname: A classname, if None the first childclass of BaseModel is returned
-    :return: The model class
-    """
-
-    module = load_module_from_path(path_to_module)
-    if classname:
-        return getattr(module, classname)
-    else:
-        # Loop through all members of the module and detect a class that is derived
-        # from the cmflumped.BaseModel
-        for name, obj in vars(module).items():
-            if (
-                    name[0] != '_'
-                    and isinstance(obj, type)
-                    and obj is not module.BaseModel
-                    and issubclass(obj, module.BaseModel)
-            ):
-                return obj
-        # Raise Error if no fitting class is found
-        raise ValueError(f'Module "{path_to_module}" has no class that derives from cmflumped.BaseModel')
+from .loader import load_module_from_path, get_model_class
 
 
 def u(vmin, vmax, default=None, doc=None):
@@ -83,19 +42,93 @@ def constant(vmin, vmax, default=None, doc=None):
     return Constant(default, optguess=default, minbound=vmin, maxbound=vmax, doc=doc)
 
 
+def _nse_pbias(evaluation, simulation):
+    """
+    Calculates the Nash-Sutcliffe efficiency and the percentual bias together,
+    both share the difference between simulation and evaluation.
+    Like in spotpy.objectivefunctions, NaN values are ignored.
+
+    The simulation can be a 2D array with one run per row, then the objectives
+    of all runs are calculated in one pass
+    :return: nse, pbias (floats, or arrays with one value per run)
+    """
+    if len(evaluation) != simulation.shape[-1]:
+        nan = np.full(simulation.shape[:-1], np.nan)[()]
+        return nan, nan
+    diff = simulation - evaluation
+    missing = np.isnan(diff)
+    diff[missing] = 0.0
+    obs = evaluation[~np.isnan(evaluation)]
+    anomaly = obs - obs.mean()
+    # The sums of squares as dot products, without temporary arrays
+    nse = 1 - np.einsum('...i,...i', diff, diff) / anomaly.dot(anomaly)
+    pbias = 100 * diff.sum(axis=-1) / obs.sum()
+    # A run without any simulated value, eg. an infeasible parameter set, has no objectives
+    empty = missing.all(axis=-1)
+    if empty.any():
+        nse = np.where(empty, np.nan, nse)[()]
+        pbias = np.where(empty, np.nan, pbias)[()]
+    return nse, pbias
+
+
 class BaseParameters:
 
     def __get__(self, instance, owner):
         # A magic method for simple use of this object
-        return spotpy.parameter.get_parameters_from_setup(self)
+        return self.get_parameters()
+
+    @classmethod
+    def get_parameters(cls):
+        """
+        Returns the list of spotpy parameters defined in this class.
+        The parameters are collected only once per class
+        """
+        if '_parameters' not in vars(cls):
+            cls._parameters = spotpy.parameter.get_parameters_from_setup(cls())
+        return cls._parameters
 
     @classmethod
     def to_string(cls):
-        params = cls()
-        return cls.__doc__ + '\n'.join(
-            f':{p.name}: [{p.minbound:0.4g}..{p.maxbound:0.4g}] {p.description}'
-            for p in spotpy.parameter.get_parameters_from_setup(params)
-        )
+        if '_string' not in vars(cls):
+            cls._string = cls.__doc__ + '\n'.join(
+                f':{p.name}: [{p.minbound:0.4g}..{p.maxbound:0.4g}] {p.description}'
+                for p in cls.get_parameters()
+            )
+        return cls._string
+
+    @classmethod
+    def as_array(cls, samples, dtype=np.float32):
+        """
+        Stores parameter sets in a contiguous 2D array with one row per set and
+        one column per parameter, in the order of get_parameters. The array is much smaller
+        than the parameter set objects and can be used for sensitivity measures, eg.
+        np.corrcoef, and as parameter_matrix of BaseModel.simulate_batch
+        :param samples: An iterable of spotpy parameter sets (or sequences of values)
+        :param dtype: The type of the values, float32 is precise enough for analysis,
+                      use np.float64 to run the exact parameter sets again
+        :return: 2D array of shape (number of samples, number of parameters)
+        """
+        matrix = np.array([tuple(s) for s in samples], dtype=dtype, ndmin=2)
+        n_params = len(cls.get_parameters())
+        if matrix.size and matrix.shape[1] != n_params:
+            raise ValueError(
+                f'{cls.__name__} has {n_params} parameters, but the samples have {matrix.shape[1]} values'
+            )
+        return matrix.reshape(-1, n_params)
+
+
+def _restore_model(module_name, filename, classname, args, kwargs):
+    """
+    Creates a pickled model again, see BaseModel.__reduce__. The class is taken from
+    the loaded module, or the module is loaded from its file, eg. in a spawned worker
+    """
+    module = sys.modules.get(module_name)
+    if module is not None and os.path.abspath(getattr(module, '__file__', None) or '') == filename:
+        cls = getattr(module, classname)
+    else:
+        cls = get_model_class(filename, classname)
+    return cls(*args, **kwargs)
+
 
 class BaseModel(DocClass):
     """
@@ -105,6 +138,32 @@ class BaseModel(DocClass):
     verbose = True
     calibration_start = 2000
     validation_start = 2010
+    # Relative tolerance of the solver
+    rtol = 1e-6
+    # Linear solver of CVode: 0 dense, 2 diagonal, 3 Krylov (cmf's default).
+    # A lumped model has only a few states, the dense solver is the fastest for them
+    linear_solver = 0
+
+    # Number of simulations kept for repeated parameter sets, eg. of grid or one-at-a-time
+    # sensitivity samples. Each simulation takes 8 bytes per time step. 0 means no cache
+    memo_size = 0
+
+    _solver = None
+    _last_parameters = None
+    _memo = None
+
+    # All subclasses of BaseModel by the name of their module, see get_model_class
+    _registry = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        BaseModel._registry.setdefault(cls.__module__, []).append(cls)
+
+    def __new__(cls, *args, **kwargs):
+        # The arguments of the model class are kept, to create the model again in another process
+        self = super().__new__(cls)
+        self._init_args = args, kwargs
+        return self
 
     def __init__(self, dataprovider: DataProvider, name: str = None):
         """
@@ -116,6 +175,9 @@ class BaseModel(DocClass):
         self.cell: cmf.Cell = self.project.NewCell(0, 0, 0, 1000)
 
         self.create_nodes()
+        if hasattr(self, 'outlet'):
+            # Bound method for the default output, saves two attribute lookups per time step
+            self._outlet_waterbalance = self.outlet.waterbalance
         self.data.add_stations(self.project)
         self.create_connections(spotpy.parameter.create_set(self, 'optguess'))
 
@@ -138,6 +200,29 @@ class BaseModel(DocClass):
     def create_connections(self, p):
         ...
 
+    def set_parameters(self, p):
+        """
+        Applies the parameter set p to the model before a run. The default calls
+        `create_connections` again. cmf replaces an existing connection between the same
+        nodes, hence the project does not grow with the number of runs.
+
+        Override this method to update only the attributes of connections kept
+        from `create_connections`, without changing the structure of the project.
+        :param p: The parameters object
+        :return: None
+        """
+        self.create_connections(p)
+
+    def is_feasible(self, p):
+        """
+        Checks a parameter set before a simulation. Override this method to reject
+        parameter combinations that make no sense for the model. The simulation of a rejected
+        parameter set is skipped and returns only NaN values, with NaN as objectives.
+        :param p: The parameters object
+        :return: True, if the model should run with p
+        """
+        return True
+
     def initial_values(self, p):
         """
         Is called before a simulation starts and should reset
@@ -148,34 +233,80 @@ class BaseModel(DocClass):
         ...
 
     def create_result_structure(self):
-        outflow = cmf.timeseries(self.data.begin, cmf.day)
-        outflow.add(self.outlet(self.data.begin))
+        """
+        Creates the container to store the results in, an array with one value
+        per day of the data period. The first value is the outflow at the begin.
+        """
+        n = (self.data.end - self.data.begin).days + 1
+        outflow = np.empty(n, dtype=np.float64)
+        outflow[0] = self.outlet(self.data.begin)
+        self._result_index = 1
         return outflow
 
     def fill_result_structure(self, result, t):
-        q = self.output(t)
-        result.add(q)
-        if self.verbose:
-            print(f'{t!s:>12s} Q={q:10.5g}mm/day')
+        """
+        Stores the output of the time step t in the result structure.
+        Printing in verbose mode is done by the simulation for this default
+        method. A model that overrides it prints its own verbose output
+        """
+        result[self._result_index] = self.output(t)
+        self._result_index += 1
 # <- OVERRIDE
+    def _fill_verbose(self, result, t):
+        """
+        Stores the output of the time step like fill_result_structure and prints it.
+        The lines are buffered and written once per simulated year
+        """
+        q = self.output(t)
+        result[self._result_index] = q
+        self._result_index += 1
+        self._log_buf.append(f'{t!s:>12s} Q={q:10.5g}mm/day')
+        if len(self._log_buf) >= 365:
+            self._flush_log()
+
+    def _flush_log(self):
+        """
+        Writes the buffered lines of _fill_verbose to stdout
+        """
+        if self._log_buf:
+            sys.stdout.write('\n'.join(self._log_buf) + '\n')
+            self._log_buf.clear()
+
     def add_layers(self, *thickness):
-        return tuple(
-            self.cell.add_layer(d)
-            for d in np.cumsum(thickness)
-        )
+        """
+        Adds soil layers with the given thicknesses in m to the cell
+        :return: A tuple of the new layers
+        """
+        cell = self.cell
+        depth = 0.0
+        layers = []
+        for d in thickness:
+            depth += d
+            layers.append(cell.add_layer(depth))
+        return tuple(layers)
 
     def iterate(self, p = None):
         """
-        Calls `create_connections` and `inital_values` to shape
+        Calls `set_parameters` and `inital_values` to shape
         the model using the parameter set `p` and returns an
-        iterator that advances the model over the whole data period
+        iterator that advances the model over the whole data period.
+
+        `set_parameters` is skipped, if `p` has the same values as in the last call.
+        The solver is created on the first call and reset for each further call
         """
-        self.create_connections(p)
+        parameters = None if p is None else tuple(p)
+        if parameters is None or parameters != self._last_parameters:
+            self.set_parameters(p)
+            self._last_parameters = parameters
         self.initial_values(p)
 
-        solver = cmf.CVodeIntegrator(self.project, 1e-9)
-        solver.use_OpenMP = False
-        return solver.run(self.data.begin, self.data.end, cmf.day)
+        if self._solver is None:
+            self._solver = cmf.CVodeIntegrator(self.project, self.rtol)
+            self._solver.LinearSolver = self.linear_solver
+            self._solver.use_OpenMP = False
+        else:
+            self._solver.reset()
+        return self._solver.run(self.data.begin, self.data.end, cmf.day)
 
     def output(self, t):
         """
@@ -183,35 +314,140 @@ class BaseModel(DocClass):
         :param t: Time step of the model
         :return: A value representing the model output
         """
-        return self.outlet.waterbalance(t)
+        return self._outlet_waterbalance(t)
 
     def __str__(self):
         return self.name
 
+    def __reduce__(self):
+        """
+        cmf objects can not be pickled. To send a model to another process, eg. a
+        worker of a parallel sampler, only the file and name of the class and the arguments
+        of the model class are pickled, and the model is created again in the other process.
+        The file is loaded again, if the module is not loaded in the other process.
+        """
+        cls = type(self)
+        filename = getattr(sys.modules.get(cls.__module__), '__file__', None)
+        if filename is None or '<locals>' in cls.__qualname__:
+            raise pickle.PicklingError(
+                f'{cls.__qualname__} can not be sent to another process, '
+                'it is not defined at the top level of a Python file'
+            )
+        args, kwargs = self._init_args
+        return (
+            _restore_model,
+            (cls.__module__, os.path.abspath(filename), cls.__qualname__, args, kwargs),
+            {'verbose': self.verbose, 'name': self.name}
+        )
+
     def simulation(self, vector):
         """
         This function is only important for spotpy,
-        otherwise it is equivalent with "run"
+        otherwise it is equivalent with "run".
+
+        If memo_size is set, the results of the last memo_size parameter sets are kept,
+        with parameter values rounded to 6 decimals as key. A repeated parameter set returns
+        the kept read only result without running the model again
         :param vector:
         :return:
         """
+        if not self.is_feasible(vector):
+            return np.full(len(self.evaluation()), np.nan)
+        if self.memo_size:
+            key = tuple(np.round(np.asarray(tuple(vector), dtype=np.float64), 6).tolist())
+            if self._memo is None:
+                self._memo = OrderedDict()
+            elif key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+
         result = self.create_result_structure()
         duration = datetime.datetime.now()
 
-        for t in self.iterate(vector):
-            self.fill_result_structure(result, t)
-        result_array = np.array(result)
+        timesteps = self.iterate(vector)
+        default_fill = type(self).fill_result_structure is BaseModel.fill_result_structure
+        if not self.verbose and default_fill and isinstance(result, np.ndarray):
+            # Fast path for the default result structure, the loop uses only local names
+            output = self.output
+            i = self._result_index
+            for t in timesteps:
+                result[i] = output(t)
+                i += 1
+            self._result_index = i
+        else:
+            # Select the fill method once, to keep the verbose check out of the time loop.
+            # An overridden fill_result_structure prints its own verbose output
+            fill = self._fill_verbose if self.verbose and default_fill else self.fill_result_structure
+            self._log_buf = []
+            for t in timesteps:
+                fill(result, t)
+            self._flush_log()
+        if isinstance(result, np.ndarray):
+            # A view without copy, the result is shorter if the run stopped early
+            result_array = result[:self._result_index]
+        else:
+            result_array = np.asarray(result, dtype=np.float64)
         if self.verbose:
             print('objective: NSE_c={:0.4g}, NSE_v={:0.4g}, PBIAS_c={:0.4g}, PBIAS_v={:0.4g}'.format(*self.objectivefunction(result_array, self.evaluation())))
             print('duration:', datetime.datetime.now() - duration)
+        if self.memo_size:
+            result_array.flags.writeable = False
+            self._memo[key] = result_array
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
         return result_array
 
+    def simulate_batch(self, parameter_matrix):
+        """
+        Runs the model for each row of a parameter matrix, eg. from SALib or a
+        Monte Carlo sample. All runs use the project and solver of this model,
+        only `set_parameters` and `initial_values` are called between the runs.
+
+        :param parameter_matrix: 2D array with one parameter set per row, the columns
+                                 in the order of the model's parameters
+        :return: 2D array with the simulation of each parameter set per row,
+                 with no rows for an empty parameter matrix
+        """
+        names = spotpy.parameter.get_parameters_array(self)['name']
+        if len(parameter_matrix) == 0:
+            # One value per day of the data period, like the default result structure
+            return np.empty((0, (self.data.end - self.data.begin).days + 1))
+        result = None
+        verbose, self.verbose = self.verbose, False
+        try:
+            for i, row in enumerate(parameter_matrix):
+                p = spotpy.parameter.create_set(self, **dict(zip(names, row)))
+                sim = self.simulation(p)
+                if result is None:
+                    result = np.empty((len(parameter_matrix), len(sim)))
+                result[i] = sim
+        finally:
+            self.verbose = verbose
+        return result
+
     def evaluation(self):
         """
         Returns the evaluation data
         """
-        runoff = self.data.Q
-        return np.array(runoff)
+        return self.data.Q_array
+
+    def _period_index(self):
+        """
+        Returns the array positions for Jan 1st of the calibration and validation start
+        """
+        key = (self.data.begin, self.calibration_start, self.validation_start)
+        if getattr(self, '_period_key', None) != key:
+            def getindex(year):
+                """
+                Returns the array position for Jan 1st of the respective year
+                :param year: a year
+                :return: int
+                """
+                return datetime.date(year, 1, 1).toordinal() - self.data.begin_ord
+
+            self._period_key = key
+            self._period_start = getindex(self.calibration_start), getindex(self.validation_start)
+        return self._period_start
 
     def objectivefunction(self, simulation, evaluation):
         """
@@ -227,24 +463,17 @@ class BaseModel(DocClass):
          - :math:`PBIAS_v`: the procentual bias between model and observation
             for the validation period (self.end:self.data.end)
 
-        and returns these objectives as a list in that order
-        """
+        and returns these objectives as a list in that order.
 
-        def getindex(year):
-            """
-            Returns the array position for Jan 1st of the respective year
-            :param year: a year
-            :return: int
-            """
-            dt = datetime.datetime(year, 1, 1)
-            return (dt - self.data.begin).days
+        The simulation may be the 2D result of `simulate_batch`, then each
+        objective is an array with one value per run
+        """
 
-        c_start = getindex(self.calibration_start)
-        v_start = getindex(self.validation_start)
-        nse_c = spotpy.objectivefunctions.nashsutcliffe(evaluation[c_start:v_start], simulation[c_start:v_start])
-        pbias_c = spotpy.objectivefunctions.pbias(evaluation[c_start:v_start], simulation[c_start:v_start])
-        nse_v = spotpy.objectivefunctions.nashsutcliffe(evaluation[v_start:], simulation[v_start:])
-        pbias_v = spotpy.objectivefunctions.pbias(evaluation[v_start:], simulation[v_start:])
+        c_start, v_start = self._period_index()
+        simulation = np.asarray(simulation, dtype=np.float64)
+        evaluation = np.asarray(evaluation, dtype=np.float64)
+        nse_c, pbias_c = _nse_pbias(evaluation[c_start:v_start], simulation[..., c_start:v_start])
+        nse_v, pbias_v = _nse_pbias(evaluation[v_start:], simulation[..., v_start:])
 
         return [nse_c, nse_v, pbias_c, pbias_v]
 
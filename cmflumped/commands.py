@@ -1,10 +1,17 @@
-from .basemodel import get_model_class as _get_model_class
-from .basemodel import BaseModel as _BaseModel
+# Only light imports here, cmf, spotpy etc. are imported by the commands on demand
+from .loader import get_model_class as _get_model_class
 
 
-def help(*args, **kwargs):
+def help():
+    """
+    Prints the usage of all commands
+    Usage: cmf.lumped help
+           cmf.lumped <command> --help
+    The old usage cmf.lumped <command> <model.py> help still prints the usage of the command
+    """
+    from .__main__ import get_commands
     print('Runs a custom build lumped cmf model')
-    for n, f in commands.items():
+    for n, f in get_commands().items():
         print()
         print(f'cmf.lumped {n} ...')
         print(f.__doc__)
@@ -38,25 +45,42 @@ def result(*setups):
 def doc(*setups, in_browser=False):
     """
     Creates documentation files for the model
-    Usage: cmflumped doc <model.py>
-           <model.py>: The Python file containing the model
+    Usage: cmflumped doc <model.py> [<model2.py> ...]
+           <model.py>: The Python file containing the model,
+                       the documentations of several models are built in parallel
     """
-    import matplotlib as mpl
-    mpl.use('Agg')
-    from cmflumped.doctools import Documentation
-    # Schreibe die rst-Dateien
-    for setup in setups:
-        model = _get_model_class(setup)()
-        docu = Documentation(model)
-        docu.make_rst()
-        # Erzeuge die HTML-Dokumentation
-        build_dir = docu.compile_html()
+    if len(setups) > 1:
+        # The documentations are independent, build them in parallel processes.
+        # Like the sampling, the workers are spawned and do not inherit the state of cmf and OpenMP
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=len(setups),
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            build_dir = list(executor.map(_make_doc, setups))[-1]
+    else:
+        build_dir = _make_doc(setups[0])
 
     if in_browser:
         import webbrowser
         webbrowser.open((build_dir / 'html' / 'index.html').as_uri())
 
 
+def _make_doc(setup):
+    """
+    Writes the rst files and the HTML documentation for a model file
+    :return: The build directory of the documentation
+    """
+    import matplotlib as mpl
+    mpl.use('Agg')
+    from cmflumped.doctools import Documentation
+    model = _get_model_class(setup)()
+    docu = Documentation(model)
+    # Schreibe die rst-Dateien
+    docu.make_rst()
+    # Erzeuge die HTML-Dokumentation
+    return docu.compile_html()
+
+
 def descr(model):
     """
     Prints out a description of your model
@@ -68,27 +92,34 @@ def descr(model):
     print(cmf.describe(m.project))
 
 
-def run(model, runs=None, sampler='lhs', dbformat='hdf5', parallel=None):
+def run(model, runs=None, sampler='lhs', dbformat='hdf5', parallel=None, workers=None):
     """
     Runs the model
-    Usage: cmf.lumped run <model.py> [runs] [sampler]
+    Usage: cmf.lumped run <model.py> [runs] [sampler] [--workers=N]
            <model.py>: The Python file containing the model
            [runs]: Number of runs (default=1)
            [sampler]: spotpy sampler to use,
                 eg. mc (Monte Carlo), lhs (latin hypercube sampling), dds - see spotpy documentation
+           [--workers]: Number of parallel processes for the sampling,
+                default: the environment variable CMFLUMPED_WORKERS
+           Each argument can also be given by name, as --runs=1000 or runs=1000
 
     Example:
         Single run:
             cmf.lumped run example/model1.py
         Many runs:
             cmf.lumped run example/model1.py 1000 lhs
+            cmf.lumped run example/model1.py runs=1000 sampler=lhs
+        Many runs on 4 cores:
+            cmf.lumped run example/model1.py 1000 lhs --workers=4
     """
     from cmflumped.spotpy_helper import sample
-    m: _BaseModel = _get_model_class(model)()
+    m = _get_model_class(model)()
     m.verbose = not runs
     if runs:
         n = int(runs)
-        sample(m, n, sampler, save_threshold=0.0, dbformat=dbformat, parallel=parallel)
+        sample(m, n, sampler, save_threshold=0.0, dbformat=dbformat, parallel=parallel,
+               workers=workers and int(workers))
     else:
         from spotpy.parameter import create_set
         p = create_set(m, 'optguess')
@@ -1,6 +1,9 @@
 import cmf
+import numpy as np
 import pandas as pd
 import datetime as dt
+import os
+from functools import lru_cache
 
 class DataProvider:
     """
@@ -32,13 +35,18 @@ class DataProvider:
             return cmf.timeseries.from_array(self.begin, self.step, a)
 
         def get_col(c):
+            """Returns a column as a contiguous float64 array, cmf copies it as a single buffer"""
             if type(c) is int:
-                return data[data.columns[c]]
-            else:
-                return data[c]
+                c = data.columns[c]
+            return np.ascontiguousarray(data[c].to_numpy(dtype=np.float64))
 
         self.P = a2ts(get_col(P))
-        self.Q = a2ts(get_col(Q))
+        q = get_col(Q)
+        self.Q = a2ts(q)
+        # The discharge as a read only array for the objective functions, built only once
+        self.Q_array = np.array(q)
+        self.Q_array.flags.writeable = False
+        self.begin_ord = self.begin.toordinal()
         self.ETpot = a2ts(get_col(E))
 
         self.Tmin = a2ts(get_col(Tmin)) if Tmin else None
@@ -76,7 +84,8 @@ class DataProvider:
             print(ts_name, cmf.describe(ts).replace('\n', ''))
 
 
-def load_csv(csv_file: str, date=0, Q='Q', P='P', E='ETpot', Tmin=None, Tmax=None, **kwargs) -> DataProvider:
+def load_csv(csv_file: str, date=0, Q='Q', P='P', E='ETpot', Tmin=None, Tmax=None, date_format=None,
+             **kwargs) -> DataProvider:
     """
     Loads driver and calibration
     -----------------------------
@@ -90,8 +99,11 @@ def load_csv(csv_file: str, date=0, Q='Q', P='P', E='ETpot', Tmin=None, Tmax=Non
                 - None means no Temperature is given
     :param Tmax: Name or index of the dataframe's column containing the daily min Temperature (°C)
                 - None means: use Tmin as daily average Temperature
+    :param date_format: strftime format of the dates, eg. '%Y-%m-%d'
+                - None means: the format is inferred by pandas
 
-    :param kwargs: Keyword arguments to be passed on to pandas.load_csv
+    :param kwargs: Keyword arguments to be passed on to pandas.read_csv, except index_col and usecols.
+                A dtype dict is merged with the dtypes of the columns
 
     :return: A DataProvider object
 
@@ -108,6 +120,80 @@ def load_csv(csv_file: str, date=0, Q='Q', P='P', E='ETpot', Tmin=None, Tmax=Non
     Usage with column positions:
     >>> data = load_csv('pteq.csv', date=0, P=1, E=3, Tmin=2, Q=4)
     """
-    data = pd.read_csv(csv_file, index_col=[date], parse_dates=True)
-    return DataProvider(data, Q, P, E, Tmin, Tmax)
+    fixed = {'index_col', 'usecols'} & set(kwargs)
+    if fixed:
+        raise ValueError(
+            f'load_csv selects the columns by date, Q, P, E, Tmin and Tmax, '
+            f'{", ".join(sorted(fixed))} can not be passed to pandas.read_csv'
+        )
+    columns = (Q, P, E, Tmin, Tmax)
+    read_kwargs = tuple(sorted(kwargs.items()))
+    if isinstance(csv_file, (str, os.PathLike)) and _is_hashable((date, columns, date_format, read_kwargs)):
+        # The parsed table is cached by file and arguments, eg. for each new model in a process
+        data, names = _read_csv(
+            os.path.abspath(csv_file), os.path.getmtime(csv_file), date, columns,
+            date_format, read_kwargs
+        )
+    else:
+        # A buffer instead of a file name or unhashable arguments for pandas, not cached
+        data, names = _read_csv.__wrapped__(csv_file, None, date, columns, date_format, read_kwargs)
+    return DataProvider(data, *names)
+
+
+def _is_hashable(value):
+    """
+    Returns True, if value can be used as a key of the cache of _read_csv
+    """
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=8)
+def _read_csv(csv_file, mtime, date, columns, date_format, kwargs):
+    """
+    Reads the date and the given columns of a csv file for load_csv. The modification time
+    is only part of the cache key, a changed file is read again. The returned data frame is
+    shared by the callers and must not be changed.
+    :return: data frame, the names of the columns Q, P, E, Tmin, Tmax
+    """
+    kwargs = dict(kwargs)
+    # Read only the header to translate column positions into names
+    start = csv_file.tell() if hasattr(csv_file, 'seek') else None
+    header = pd.read_csv(csv_file, nrows=0, **kwargs).columns
+    if start is not None:
+        # A buffer is read again from the same position
+        csv_file.seek(start)
+    date_col = header[date] if type(date) is int else date
+    value_cols = header.drop(date_col)
+
+    def col_name(c):
+        """Returns the name of a column given by name or position (not counting the date column)"""
+        if c is None:
+            return None
+        return value_cols[c] if type(c) is int else c
+
+    names = tuple(col_name(c) for c in columns)
+    columns = list(dict.fromkeys(c for c in names if c is not None))
+
+    # Read only the needed columns with the C parser and without type inference.
+    # A file is mapped into memory and parsed without copies into a read buffer
+    read_args = dict(
+        engine='c',
+        memory_map=start is None,
+    )
+    # The engine and memory mapping can be changed by the caller, the dtypes are merged
+    read_args.update(kwargs)
+    dtype = {date_col: str, **{c: np.float64 for c in columns}}
+    if isinstance(read_args.get('dtype'), dict):
+        dtype.update(read_args['dtype'])
+    elif read_args.get('dtype') is not None:
+        dtype = read_args['dtype']
+    read_args.update(usecols=[date_col] + columns, dtype=dtype)
+    data = pd.read_csv(csv_file, index_col=date_col, **read_args)
+    # Parse all dates in one call with a known format, repeated dates are parsed only once
+    data.index = pd.to_datetime(data.index, format=date_format, cache=True)
+    return data, names
 
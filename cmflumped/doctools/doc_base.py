@@ -1,4 +1,22 @@
 from textwrap import dedent
+from functools import lru_cache
+
+
+@lru_cache(maxsize=128)
+def _parse_spec(format_spec):
+    """
+    Splits the format spec of a DocFunction into the named and the positional arguments
+    :return: dict of named arguments, tuple of positional arguments
+    """
+    named = {}
+    args = []
+    for item in format_spec.split(';'):
+        if '=' in item:
+            k, v = item.split('=', 1)
+            named[k.strip()] = v.strip()
+        elif item:
+            args.append(item.strip())
+    return named, tuple(args)
 
 
 class DocFunction:
@@ -7,22 +25,27 @@ class DocFunction:
         self.template = dedent(template)
 
     def __format__(self, format_spec):
-        kwargs = self.kwargs.copy()
-        args = []
-        pair: str
-        for item in format_spec.split(';'):
-            if '=' in item:
-                k, v = item.split('=', 1)
-                kwargs[k.strip()] = v.strip()
-            elif item:
-                args.append(item.strip())
-
-        for k, a in zip(self.kwargs, args):
-            kwargs[k] = a
-
+        named, args = _parse_spec(format_spec)
+        # Positional arguments fill the keyword arguments of the template in their order
+        kwargs = {**self.kwargs, **named, **dict(zip(self.kwargs, args))}
         return self.template.format(**kwargs)
 
 
+def _collect_docfunctions(cls):
+    """
+    Returns the DocFunction attributes of a class, including the inherited ones
+    """
+    docfunctions = {}
+    for base in reversed(cls.__mro__):
+        for k, v in vars(base).items():
+            if isinstance(v, DocFunction):
+                docfunctions[k] = v
+            else:
+                # An attribute of a subclass hides the DocFunction of the base class
+                docfunctions.pop(k, None)
+    return docfunctions
+
+
 class DocClass:
     figure = DocFunction(
         """
@@ -47,15 +70,16 @@ class DocClass:
         :members:
     """)
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._docfunctions = _collect_docfunctions(cls)
+
     @classmethod
     def describe(cls, setup=None, **kwargs) -> str:
         template = dedent(cls.__doc__)
         module = setup and setup.name
         classname = setup and setup.__class__.__name__
-        docfunctions = {
-            k: getattr(cls, k) for k in dir(cls)
-            if isinstance(getattr(cls, k), DocFunction)
-        }
+        docfunctions = cls._docfunctions
 
         for dcf in docfunctions.values():
             dcf.kwargs['module'] = module
@@ -63,3 +87,6 @@ class DocClass:
             dcf.kwargs['setup'] = setup
 
         return template.format(setup=setup, module=module, classname=classname, **docfunctions, **kwargs)
+
+
+DocClass._docfunctions = _collect_docfunctions(DocClass)
@@ -2,11 +2,12 @@
 from spotpy import describe
 from pathlib import Path
 from textwrap import dedent
+from functools import cached_property
 import cmf
 import shutil
+import os
 import re
 import sys
-from sphinx.cmd.build import make_main as sphinx_make
 from logging import getLogger
 logger = getLogger(__name__)
 
@@ -28,6 +29,7 @@ class Implementation:
     def __init__(self, setup):
         self.setup = setup
 
+    @cached_property
     def parameter_text(self):
         cls = get_doc_class(self.setup, 'Parameters')
         return (
@@ -38,10 +40,12 @@ class Implementation:
                 )
         )
 
+    @cached_property
     def model_text(self):
         cls = type(self.setup)
         return cls.describe(self.setup)
 
+    @cached_property
     def project_text(self):
         return cmf.describe(self.setup.project)
 
@@ -49,7 +53,7 @@ class Implementation:
         return f'Implementation({self.setup})'
 
     def __str__(self):
-        return '\n'.join((self.parameter_text(), self.model_text(), self.project_text()))
+        return '\n'.join((self.parameter_text, self.model_text, self.project_text))
 
 
 class Documentation:
@@ -62,18 +66,30 @@ class Documentation:
         if not (self.homedir / 'conf.py').exists():
             srcdir = Path(__file__).parent
             conf_py = srcdir / 'conf.py'
-            shutil.copy(conf_py, self.homedir)
+            shutil.copy2(conf_py, self.homedir)
 
     def __init__(self, setup, homedir: Path = None):
         self.setup = setup
+        # Keeps the texts of the implementation chapter for repeated calls of make_rst
+        self.implementation = Implementation(setup)
         self.homedir = homedir or Path(f'{name(self.setup)}-docs')
         self.homedir.mkdir(parents=True, exist_ok=True)
 
     def copy_figures(self, text):
         figures = re.findall(r'\.\. figure:: (.*)', text)
+        if not figures:
+            return
+        # One directory scan instead of a stat call per figure
+        existing = {e.name: e for e in os.scandir(self.homedir.parent) if e.is_file()}
+        copied = {e.name: e for e in os.scandir(self.homedir) if e.is_file()}
         for fig in figures:
-            if (img := self.homedir.parent / fig).exists():
-                shutil.copy(img, self.homedir)
+            if img := existing.get(fig.strip()):
+                src = img.stat()
+                dst = copied[img.name].stat() if img.name in copied else None
+                # copy2 keeps the modification time, unchanged figures are neither copied again
+                # nor trigger a rebuild by sphinx
+                if dst is None or (dst.st_mtime, dst.st_size) != (src.st_mtime, src.st_size):
+                    shutil.copy2(img.path, self.homedir)
 
     def write_doc_text(self, classname: str):
 
@@ -89,9 +105,12 @@ class Documentation:
             path = self.homedir / f'{self.setup.name}.{filename}.rst'
         else:
             path = self.homedir / f'{filename}.rst'
-
+        text = str(text)
+        # Keep unchanged files untouched, so that sphinx does not build them again
+        if path.exists() and path.read_text(encoding='utf-8') == text:
+            return
         with path.open('w', encoding='utf-8') as f:
-            f.write(str(text))
+            f.write(text)
 
     def index_text(self):
         """
@@ -126,7 +145,7 @@ class Documentation:
 
     def make_rst(self):
         self.write_doc_text('Concept')
-        self.write_text('implementation', str(Implementation(self.setup)))
+        self.write_text('implementation', str(self.implementation))
         self.write_doc_text('Result')
         self.write_doc_text('Discussion')
         self.write_doc_text('Bibliography')
@@ -139,8 +158,11 @@ class Documentation:
         """
         Erstellt aus den rst-Dateien die html-Dokumentation
         """
+        # Sphinx is only needed here and not for every import of the models
+        from sphinx.cmd.build import make_main as sphinx_make
         builddir = self.homedir / '_build'
-        args = ['-M', 'html', str(self.homedir), str(builddir)]
+        # Sphinx reuses the doctrees in the build directory and reads the sources in parallel
+        args = ['-M', 'html', str(self.homedir), str(builddir), '-j', 'auto']
         sphinx_make(args)
         return builddir
 
@@ -1,32 +1,107 @@
 
 import numpy as np
-from scipy.stats import gaussian_kde
+from scipy.signal import fftconvolve
 import tables
 import pandas as pd
 
 import yaml
+import json
 import os
+from functools import lru_cache
 
-from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from textwrap import dedent
 
 from .. import BaseModel
 from ..doctools import DocClass
 
 
+def _kde(values, x):
+    """
+    Gaussian kernel density estimate of values on the regular grid x, with the bandwidth
+    of scipy.stats.gaussian_kde (Scott's rule). The values are binned linearly to the grid
+    and convolved with the kernel by FFT, which is much faster for many values
+    """
+    n = len(values)
+    sigma = values.std(ddof=1) * n ** (-1 / 5) if n > 1 else 0.0
+    if not sigma > 0:
+        raise ValueError('The density of less than two distinct values is not defined')
+    dx = x[1] - x[0]
+    pos = (values - x[0]) / dx
+    i = np.clip(np.floor(pos).astype(int), 0, len(x) - 1)
+    w = pos - i
+    counts = np.bincount(i, 1 - w, len(x) + 1) + np.bincount(i + 1, w, len(x) + 1)
+    half = min(len(x), int(np.ceil(5 * sigma / dx)))
+    kernel = np.exp(-0.5 * (np.arange(-half, half + 1) * dx / sigma) ** 2)
+    density = fftconvolve(counts[:len(x)], kernel, mode='same')
+    return density / (n * sigma * np.sqrt(2 * np.pi))
+
+
 def result_filename(setup, path='.'):
     return os.path.join(path, str(setup) + '.result.yml')
 
 
+@lru_cache(maxsize=None)
+def _load_result(filename, mtime):
+    """
+    Loads a result summary from a json or yaml file. The modification time
+    is only part of the cache key, a changed file is loaded again
+    """
+    with open(filename) as f:
+        if filename.endswith('.json'):
+            return json.load(f)
+        else:
+            return yaml.safe_load(f)
+
+
+@lru_cache(maxsize=None)
+def _calc_threshold(filename, mtime, tablename, n_min):
+    """
+    Calculates the rejection criteria of BaseResult.calculate_threshold from the like1 column
+    of a result table. The modification time is only part of the cache key, the threshold
+    of a changed file is calculated again
+    :return: threshold, number of runs above the threshold
+    """
+    with tables.open_file(filename) as f:
+        like1 = f.get_node('/' + tablename).col('like1')
+    # Candidate NSE thresholds from 0.7 down to -2 in steps of 0.05
+    thresholds = [0.7]
+    while thresholds[-1] > -2:
+        thresholds.append(thresholds[-1] - 0.05)
+    # The thresholds are compared in the precision of the stored like1 values
+    like1 = like1[~np.isnan(like1)]
+    steps = np.asarray(thresholds, like1.dtype)
+    if n_min <= 0:
+        enough = np.ones(len(steps), dtype=bool)
+    elif n_min <= len(like1):
+        # A threshold has enough runs, if it is below the n_min-th best run.
+        # np.partition finds that run in linear time, without sorting like1
+        nth_best = np.partition(like1, -n_min)[-n_min]
+        enough = nth_best > steps
+    else:
+        enough = np.zeros(len(steps), dtype=bool)
+    # Take the first threshold with enough runs, or the last one
+    i = int(enough.argmax()) if enough.any() else len(thresholds) - 1
+    return thresholds[i], np.count_nonzero(like1 > steps[i])
+
+
 class BaseResult(DocClass):
     """
     A base class for documentary result classes. See usage in example/model2.py
     """
     @classmethod
     def describe(cls, setup=None, **kwargs) -> str:
-        with open(result_filename(setup)) as f:
-            data = yaml.safe_load(f)
-            return super().describe(setup, **data)
+        filename = result_filename(setup)
+        # Prefer the json copy of the result summary, it is much faster to parse
+        json_filename = os.path.splitext(filename)[0] + '.json'
+        if os.path.exists(json_filename) and (
+                not os.path.exists(filename) or
+                os.path.getmtime(json_filename) >= os.path.getmtime(filename)
+        ):
+            filename = json_filename
+        data = _load_result(filename, os.path.getmtime(filename))
+        return super().describe(setup, **data)
 
     threshold = None
     def calculate_threshold(self, n_min=30):
@@ -37,25 +112,22 @@ class BaseResult(DocClass):
 
         :param n_min: Minimum number of behavioural runs
         """
-        # Calculate NSE threshold
-        threshold = 0.7
-        n = 0
-        while np.sum(np.array(self.data.cols.like1[:]) > threshold) < n_min and threshold > -2:
-            threshold -= 0.05
-        n = np.sum(np.array(self.data.cols.like1[:]) > threshold)
-        return threshold, n
+        filename = os.path.abspath(self.result_filename)
+        return _calc_threshold(filename, os.path.getmtime(filename), str(self.model), n_min)
 
     def __init__(self, model: BaseModel, result_file: str = None, outputdir = '.'):
         self.name = model.name
         if not hasattr(self, 'result_filename'):
             self.result_filename = result_file or f'{self.name}.h5'
 
-        self.data_file = tables.open_file(self.result_filename)
-        self.data = self.data_file.get_node(f'/{model}')
         self.model = model
+        self._open_table(self.result_filename)
         # Calculate the behavioural model
         self.threshold, self.n = self.calculate_threshold()
         self.obs = self.model.data.Q.to_pandas()
+        # The time axis of the results, one value for each observation
+        data = self.model.data
+        self._time = np.datetime64(data.begin) + np.timedelta64(data.step) * np.arange(len(self.obs))
         self.outputdir = outputdir
 
     def save(self, verbose):
@@ -66,6 +138,8 @@ class BaseResult(DocClass):
             print(data)
         with open(self.filename('result', 'yml'), 'w') as f:
             yaml.safe_dump(data, f)
+        with open(self.filename('result', 'json'), 'w') as f:
+            json.dump(data, f)
 
     def prune_results(self, condition='like1>=0.0'):
         """
@@ -74,13 +148,38 @@ class BaseResult(DocClass):
         :return:
         """
         new_filename = self.result_filename.replace('.h5','.pruned.h5')
-        pruned_data = self.data.read_where(condition)
+        # Copy the selected rows in chunks of the table's buffer size, not all at once
+        coords = self.data.get_where_list(condition)
+        chunksize = self.data.nrowsinbuf
         with tables.open_file(new_filename, 'w') as o:
-            tab = tables.Table(o.root, self.name, self.data.description)
-            tab.append(pruned_data)
+            # The pruned copy is compressed, it is read more often than written.
+            # The chunks are sized for the number of selected rows
+            filters = tables.Filters(complevel=5, complib='blosc', shuffle=True)
+            tab = tables.Table(o.root, self.name, self.data.description, filters=filters,
+                               expectedrows=max(len(coords), 1))
+            for start in range(0, len(coords), chunksize):
+                tab.append(self.data.read_coordinates(coords[start:start + chunksize]))
+            tab.flush()
+            # Index for fast queries of like1
+            tab.cols.like1.create_csindex()
+        # Release the handle of the unpruned file before the pruned file is opened
+        self.close()
         self.result_filename = new_filename
-        self.data_file = tables.open_file(self.result_filename)
+        self._open_table(self.result_filename)
+
+    def _open_table(self, filename):
+        """
+        Opens the result table and reads the like1 column, which is used by most methods.
+        The parameter and objective columns are partitioned only once
+        """
+        self.data_file = tables.open_file(filename)
         self.data = self.data_file.get_node(f'/{self.model}')
+        self._like1 = self.data.col('like1')
+        self._par_cols = [colname for colname in self.data.colnames if colname.startswith('par')]
+        self._like_cols = [colname for colname in self.data.colnames if colname.startswith('like')]
+        # Runs of infeasible parameter sets have NaN as objective and are never the best
+        finite = ~np.isnan(self._like1)
+        self._best_run_id = int(np.nanargmax(self._like1)) if finite.any() else 0
 
     def close(self):
         self.data_file.close()
@@ -103,24 +202,27 @@ class BaseResult(DocClass):
         """
         Plots the distribution of parameters in the behavioural runs
         """
-        take = np.array(self.data.cols.like1[:] > self.threshold)
-        fig = plt.figure(figsize=(8, 8), dpi=100)
-        p_names = [cn[3:] for cn in self.data.colnames if cn[:3] == 'par']
-        letters = [chr(ord('a') + i) for i in range(20)]
-        for i, pn in enumerate(p_names):
-            plt.subplot(((len(p_names)-1) // 3) + 1, 3, i + 1)
-            params = self.data.col(f'par{pn}')[take]
-            plt.plot(params, self.data.col('like1')[take], 'x')
-            plt.title(pn.replace('_', ' '), loc='left', fontsize=10)
+        # Read the behavioural runs at once and take the columns from memory
+        rows = self.data.read_where('like1 > threshold', {'threshold': self.threshold})
+        like1 = rows['like1']
+        # The figures are only saved, hence they are drawn by Agg without pyplot
+        fig = Figure(figsize=(8, 8), dpi=100)
+        FigureCanvasAgg(fig)
+        p_names = [cn[len('par'):] for cn in self._par_cols]
+        for i, (pn, cn) in enumerate(zip(p_names, self._par_cols)):
+            ax = fig.add_subplot(((len(p_names)-1) // 3) + 1, 3, i + 1)
+            params = rows[cn]
+            ax.plot(params, like1, 'x')
+            ax.set_title(pn.replace('_', ' '), loc='left', fontsize=10)
             try:
-                gk = gaussian_kde(params)
                 x = np.linspace(params.min(), params.max(), 1001)
-                plt.twinx()
-                plt.plot(x, gk(x), 'r:')
-                plt.yticks([])
-            except (np.linalg.linalg.LinAlgError, ValueError):
+                density = _kde(params.astype(np.float64), x)
+                ax_density = ax.twinx()
+                ax_density.plot(x, density, 'r:')
+                ax_density.set_yticks([])
+            except ValueError:
                 pass
-        plt.subplots_adjust(left=0.075, bottom=0.05, right=0.95, top=0.95, wspace=0.2, hspace=0.4)
+        fig.subplots_adjust(left=0.075, bottom=0.05, right=0.95, top=0.95, wspace=0.2, hspace=0.4)
         fig.savefig(self.filename('dotty', 'png'))
         return self.filename('dotty', 'png')
 
@@ -128,43 +230,49 @@ class BaseResult(DocClass):
         """
         Plots the result timeseries with the p5 to p95 uncertainty interval with blues
         """
-        import pylab as plt
-        nse = np.array(self.data.cols.like1)
-        best_run = nse.argmax()
-        best = self.data.cols.simulation[best_run]
+        best = self.data.cols.simulation[self._best_run_id]
+        data = self.data.read_where('like1 > threshold', {'threshold': self.threshold}, field='simulation')
 
-        take = nse > self.threshold
-        data = self.data.cols.simulation[:][take].data
+        # Both percentiles in one call, float32 is precise enough for the plot.
+        # The array is not used afterwards, hence np.percentile may partition it in place
+        p5, p95 = np.percentile(data.astype(np.float32, copy=False), [5, 95], axis=0,
+                                overwrite_input=True)
 
-        p5 = np.percentile(data, 5, 0)
-        p95 = np.percentile(data, 95, 0)
+        time = self._time
+        if not len(time) == len(best) == len(p5):
+            raise ValueError(
+                f'{self.result_filename} contains {len(best)} simulated values, '
+                f'but the data of {self.name} has {len(time)} time steps'
+            )
 
-        fig = plt.figure(figsize=(16, 8), dpi=100)
-        time = np.arange(self.model.begin, self.model.end + self.model.data.step, self.model.data.step)
+        fig = Figure(figsize=(16, 8), dpi=100)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
 
-        plt.fill_between(time, p5, p95, facecolor='b', edgecolor='none', label='Modelled uncertainty', alpha=0.3)
+        ax.fill_between(time, p5, p95, facecolor='b', edgecolor='none', label='Modelled uncertainty', alpha=0.3)
 
-        plt.plot(time, self.obs, 'k-', label='Observed')
-        plt.plot(time, best, 'b-', label='Best model')
-        ax = plt.gca()
+        ax.plot(time, self.obs, 'k-', label='Observed')
+        ax.plot(time, best, 'b-', label='Best model')
         ax.xaxis_date()
         ax.set_xlim(self.model.begin)
-        plt.axvline(np.datetime64(f'{self.model.calibration_start}-01-01'), ls='--', c='k', lw=3, alpha=0.5)
-        plt.axvline(np.datetime64(f'{self.model.validation_start}-01-01'), ls='--', c='k', lw=3, alpha=0.5)
-        plt.title('{} NSE>{:0.2f}, n={}'.format(self.name.capitalize(), self.threshold, take.sum()),
-                  fontsize=24)
-        plt.legend()
+        ax.axvline(np.datetime64(f'{self.model.calibration_start}-01-01'), ls='--', c='k', lw=3, alpha=0.5)
+        ax.axvline(np.datetime64(f'{self.model.validation_start}-01-01'), ls='--', c='k', lw=3, alpha=0.5)
+        ax.set_title('{} NSE>{:0.2f}, n={}'.format(self.name.capitalize(), self.threshold, len(data)),
+                     fontsize=24)
+        ax.legend()
 
         fig.savefig(self.filename('timeseries', 'png'))
         return self.filename('timeseries', 'png')
 
     def like(self, row):
         """Returns the 4 objective functions for a model run"""
-        return [self.data.col(colname)[row] for colname in self.data.colnames if colname.startswith('like')]
+        # Read the single row, not every like column
+        record = self.data[row]
+        return [record[colname] for colname in self._like_cols]
 
     def best_run_id(self):
         """Returns the row number of the best run"""
-        return np.array(self.data.cols.like1[:]).argmax()
+        return self._best_run_id
 
     def result_summary(self) -> dict:
         best_run_id = self.best_run_id()
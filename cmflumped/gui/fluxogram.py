@@ -6,6 +6,19 @@ import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 
 
+# Displacement of nodes by the start of their name, to make the view nicer
+_displacements = [
+    ('{' + s, np.array(d))
+    for s, d in dict(
+        Snow=(+1, 0),
+        Canopy=(-1, +1),
+        Evaporation=(-1, -18),
+        Transpiration=(-2, -18),
+        Rainfall=(0, -17.5)
+    ).items()
+]
+
+
 class Network:
 
     def __init__(self, outlet: cmf.flux_node):
@@ -13,6 +26,24 @@ class Network:
         self.graph = nx.Graph()
         self.add_node(outlet)
         self.__replace_abstract_nodes_with_concrete_storages(outlet.project)
+        self.__resolve_graph()
+
+    def __resolve_graph(self):
+        """
+        Looks up the nodes of the graph once in the order of the graph,
+        for the volume and flux queries of each animation frame.
+
+        Only the nodes are kept, not the connections: a new parameter set
+        replaces the connections of the model and the old ones become invalid
+        """
+        self._volume_nodes = [self.nodes[n] for n in self.graph.nodes]
+        self._flux_node_pairs = [(self.nodes[l], self.nodes[r]) for l, r in self.graph.edges]
+        # Only storages have a volume, the volume of the other nodes stays 0
+        storage_index = [i for i, node in enumerate(self._volume_nodes) if hasattr(node, 'volume')]
+        self._storage_index = np.array(storage_index, dtype=int)
+        self._storages = [self._volume_nodes[i] for i in storage_index]
+        self._volume_buffer = np.zeros(len(self._volume_nodes))
+        self._flux_buffer = np.zeros(len(self._flux_node_pairs))
 
     def __replace_abstract_nodes_with_concrete_storages(self, project: cmf.project):
         """
@@ -29,42 +60,51 @@ class Network:
         :param node: A CMF flux node
         :return: A [x, z] array
         """
-        displacement_dict = dict(
-            Snow=(+1, 0),
-            Canopy=(-1, +1),
-            Evaporation=(-1, -18),
-            Transpiration=(-2, -18),
-            Rainfall=(0, -17.5)
-        )
         pos = np.array(node.position)[[0, -1]]
-        for s in displacement_dict:
-            if str(node).startswith('{' + s):
-                pos += np.array(displacement_dict[s])
+        # The string of a node is formatted by cmf, do it only once
+        node_str = str(node)
+        for prefix, displacement in _displacements:
+            if node_str.startswith(prefix):
+                pos += displacement
         return pos
 
-    def add_node(self, node: cmf.flux_node):
+    def __add_graph_node(self, node: cmf.flux_node):
         """
-        Adds a cmf node and all of its connected nodes into a networkx graph
-        :param node: A cmf flux node
-        :param G: A networkx.Graph object. If None, a new Graph is created
-        :param nodes_done: A set of handled nodes, if None, a new one is created
-        :return: The graph
+        Adds a single cmf node to the graph and to the nodes, without its connections
         """
+        node_id = node.node_id
         self.graph.add_node(
-            node.node_id,
+            node_id,
             position=self.__node_pos(node),
             name=node.Name.replace(' of cell #0', '')
         )
+        self.nodes[node_id] = node
 
-        self.nodes[node.node_id] = node
+    def add_node(self, node: cmf.flux_node):
+        """
+        Adds a cmf node and all of its connected nodes into a networkx graph.
 
-        for c in node.connections:
-            target = c.get_target(node)
-            self.graph.add_edge(
-                c.left_node().node_id, c.right_node().node_id,
-                label=c.short_string().split('#')[0])
-            if target.node_id not in self.nodes:
-                self.add_node(target)
+        The network is traversed with a stack of connection iterators instead of recursion,
+        large projects do not hit the recursion limit. The nodes and edges are added in the
+        same order as by a recursive depth first search
+        :param node: A cmf flux node
+        """
+        self.__add_graph_node(node)
+        stack = [(node, iter(node.connections))]
+        while stack:
+            node, connections = stack[-1]
+            for c in connections:
+                target = c.get_target(node)
+                self.graph.add_edge(
+                    c.left_node().node_id, c.right_node().node_id,
+                    label=c.short_string().split('#')[0])
+                if target.node_id not in self.nodes:
+                    self.__add_graph_node(target)
+                    stack.append((target, iter(target.connections)))
+                    break
+            else:
+                # All connections of the node are done
+                stack.pop()
 
     def get_volume(self, node_id):
         """
@@ -80,10 +120,13 @@ class Network:
 
     def get_volumes(self):
         """
-        Returns a list of volumes for each node of the graph
+        Returns an array of volumes for each node of the graph. The array is
+        reused by the next call
         :return:
         """
-        return [self.get_volume(n) for n in self.graph.nodes]
+        volume = self._volume_buffer
+        volume[self._storage_index] = [s.volume for s in self._storages]
+        return np.maximum(volume, 0.0, out=volume)
 
     def get_connection(self, left_id, right_id)->cmf.flux_connection:
         return self.nodes[left_id].connection_to(self.nodes[right_id])
@@ -94,14 +137,14 @@ class Network:
 
     def get_fluxes(self, t):
         """
-        Returns a list a fluxes for each edge in the graph
+        Returns an array of fluxes for each edge in the graph. The array is
+        reused by the next call
         :param t: current time to query the fluxes
         :return:
         """
-        return [
-            self.get_flux(t, *e)
-            for e in self.graph.edges
-        ]
+        flux = self._flux_buffer
+        flux[:] = [left.flux_to(right, t) for left, right in self._flux_node_pairs]
+        return np.abs(flux, out=flux)
 
 
 class Fluxogram:
@@ -118,7 +161,8 @@ class Fluxogram:
         self.edge_lines = []
         self.edge_labels = []
         self.title = None
-
+        # The time of the last update, to skip redrawing an unchanged state
+        self._last_t = None
 
     def get_artists(self):
         result = [self.node_markers, self.title]
@@ -135,6 +179,8 @@ class Fluxogram:
 
         self.axis.clear()
         self.axis.set_axis_off()
+        # Buffer for the marker sizes, filled in place by update
+        self._sizes = np.empty(len(G.nodes))
         self.node_markers = nx.draw_networkx_nodes(
             G, pos, ax=self.axis, node_size=100,
             node_shape='s', node_color='#8888FF',
@@ -152,10 +198,11 @@ class Fluxogram:
 
         labels = {(l, r): v for l, r, v in G.edges.data('label')}
         if self.with_edge_labels:
-            self.edge_labels = nx.draw_networkx_edge_labels(
+            # Keep only the label artists, blitting needs artists and not the edges
+            self.edge_labels = list(nx.draw_networkx_edge_labels(
                 G, pos, ax=self.axis,
                 edge_labels=labels, font_size=7
-            )
+            ).values())
         else:
             self.edge_labels = []
 
@@ -167,12 +214,19 @@ class Fluxogram:
         )
         self.axis.set_xlim(*[x * 1.1 for x in self.axis.get_xlim()])
         plt.axis('off')
+        self._last_t = None
         return self.get_artists()
 
     def update(self, t):
+        if self._last_t is not None and t == self._last_t:
+            return self.get_artists()
+        self._last_t = t
         volume = self.network.get_volumes()  # volume of the nodes in mm/day
         flux = self.network.get_fluxes(t)  # fluxes over edges in mm/day
-        self.node_markers.set_sizes(10 * np.sqrt(volume))
+        sizes = np.sqrt(volume, out=self._sizes)
+        sizes *= 10
+        # set_sizes keeps the array and only calculates the marker transforms
+        self.node_markers.set_sizes(sizes)
         self.edge_lines.set_linewidths(flux)
         if t:
             self.title.set_text(str(t))
@@ -196,6 +250,6 @@ class Fluxogram:
 
         fa = FuncAnimation(self.axis.figure, func=self.update,
                            init_func=self.init_plot,
-                           frames=integration, blit=False,
-                           interval=1, repeat=False)
+                           frames=integration, blit=True,
+                           interval=50, repeat=False)
         return fa
@@ -33,10 +33,15 @@ class GUI:
         self.button_simulate = Widget([0.9, 0.01, 0.04, 0.03], Button, '\u25B6\u25B6', on_clicked=self.run)
         # self.button_clear = Widget([0.9, 0.01, 0.04, 0.03], Button, '\u2718', on_clicked=self.clear)
         self.setup: BaseModel = setup
+        # The parameter array of the setup is needed again for each rebuild of the sliders
+        self._params = get_parameters_array(self.setup)
         self.parameter_values = {
             p['name']: p['optguess']
-            for p in get_parameters_array(self.setup)
+            for p in self._params
         }
+        # The observation does not change, it is plotted again by each clear
+        self._obs = np.asarray(self.setup.evaluation())
+        self._obs_time = np.datetime64(self.setup.begin) + np.timedelta64(1, 'D') * np.arange(len(self._obs))
         self.sliders = self._make_widgets()
         self.lines = []
         self.running = False
@@ -70,7 +75,7 @@ class GUI:
                 s.ax.remove()
 
         sliders = []
-        params = get_parameters_array(self.setup)
+        params = self._params
 
         def calc_step():
             h = self.flux_ax.get_position().height
@@ -94,15 +99,10 @@ class GUI:
         """
         Clears the graph and plots the evalution
         """
-        obs = self.setup.evaluation()
-        day = np.timedelta64(1, 'D')
-        begin = np.datetime64(self.setup.begin)
-        time_dim = begin + day * np.arange(len(obs))
-
         self.time_ax.clear()
 
         self.lines = list(
-            self.time_ax.plot(time_dim, obs, 'k:', label='Observation', zorder=2)
+            self.time_ax.plot(self._obs_time, self._obs, 'k:', label='Observation', zorder=2)
         )
         self.time_ax.legend()
 
@@ -118,7 +118,7 @@ class GUI:
 
         parset = create_set(self.setup, **self.parameter_values)
         logger.debug('start simulation')
-        sim = np.array(self.setup.simulation(parset))
+        sim = np.asarray(self.setup.simulation(parset))
         logger.debug('simulation done')
         objf = as_scalar(self.setup.objectivefunction(sim, self.setup.evaluation()))
         day = np.timedelta64(1, 'D')
@@ -137,17 +137,23 @@ class GUI:
     def animate(self, _=None):
         logger.info('animation')
         self.running = False
-        def cmf_time_to_ms(t):
-            return (t - cmf.Time(1, 1, 1970)).AsMilliseconds()
-        outflow = [self.setup.output(self.setup.begin)]
-        timeline_ms = [cmf_time_to_ms(cmf.AsCMFtime(self.setup.begin))]
+        epoch = cmf.Time(1, 1, 1970)
+        # Buffers for the whole run, one value per day and the begin
+        n = (self.setup.end - self.setup.begin).days + 1
+        outflow = np.empty(n)
+        timeline_ms = np.empty(n, dtype=np.int64)
+        time_dim = timeline_ms.view('datetime64[ms]')
+        outflow[0] = self.setup.output(self.setup.begin)
+        timeline_ms[0] = (cmf.AsCMFtime(self.setup.begin) - epoch).AsMilliseconds()
+        count = 1
 
         def update(t):
-            outflow.append(self.setup.output(t))
-            timeline_ms.append(cmf_time_to_ms(t))
+            nonlocal count
+            outflow[count] = self.setup.output(t)
+            timeline_ms[count] = (t - epoch).AsMilliseconds()
+            count += 1
             flux_artists = self.fluxogram.update(t)
-            time_dim = np.array(timeline_ms, dtype='datetime64[ms]')
-            self.lines[-1].set_data(time_dim, outflow)
+            self.lines[-1].set_data(time_dim[:count], outflow[:count])
             return self.lines + flux_artists
 
         def init():
@@ -167,12 +173,9 @@ class GUI:
             except StopIteration:
                 pass
             finally:
-                time_dim = np.array(timeline_ms, dtype='datetime64[ms]')
-                self.lines[-1].set_data(time_dim, outflow)
+                self.lines[-1].set_data(time_dim[:count], outflow[:count])
                 self.fluxogram.init_plot(0)
                 self.fluxogram.update(t)
-                for l in self.lines:
-                    self.time_ax.figure.draw(l)
                 self.time_ax.figure.canvas.draw_idle()
                 self.flux_ax.figure.canvas.draw_idle()
 
@@ -185,7 +188,7 @@ class GUI:
             self.fig, update,
             iterator,
             init_func=init, repeat=False,
-            interval=1, blit=True
+            interval=50, blit=True
         )
 
 
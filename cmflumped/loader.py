@@ -0,0 +1,78 @@
+"""
+Loads lumped cmf models from Python files
+
+This module does not import cmf or spotpy, to keep the startup of the command line fast
+"""
+import importlib.util
+import os
+import sys
+from types import ModuleType
+
+# Loaded modules and model classes, keyed by the real path and modification time of the file
+_module_cache: dict = {}
+_class_cache: dict = {}
+
+
+def _cache_key(path_to_module: str):
+    return os.path.realpath(path_to_module), os.path.getmtime(path_to_module)
+
+
+def load_module_from_path(path_to_module:str) -> ModuleType:
+    """
+    Loads a module from a path. The module is only executed again,
+    if the file has changed since the last call
+    :param path_to_module:
+    :return:
+
+    See: https://docs.python.org/3/library/importlib.html#importing-a-source-file-directly
+    """
+    key = _cache_key(path_to_module)
+    if key in _module_cache:
+        return _module_cache[key]
+    name = os.path.basename(path_to_module).replace('.py', '')
+    spec = importlib.util.spec_from_file_location(name, path_to_module)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    _module_cache[key] = module
+    return module
+
+
+def get_model_class(path_to_module:str, classname=None):
+    """
+    This function get the class of a lumped cmf model from
+    a Python file
+    :param path_to_module: The file path to the module
+    :param classname: A classname, if None the first childclass of BaseModel is returned
+    :return: The model class
+    """
+
+    key = _cache_key(path_to_module) + (classname,)
+    if key not in _class_cache:
+        _class_cache[key] = _find_model_class(path_to_module, classname)
+    return _class_cache[key]
+
+
+def _find_model_class(path_to_module: str, classname=None):
+    module = load_module_from_path(path_to_module)
+    if classname:
+        return getattr(module, classname)
+    else:
+        from .basemodel import BaseModel
+        # Take the first model class defined in the module. Classes of an earlier
+        # execution of the module are skipped, since they are not bound in the module anymore
+        for cls in BaseModel._registry.get(module.__name__, []):
+            if cls.__name__[0] != '_' and vars(module).get(cls.__name__) is cls:
+                return cls
+        # Loop through all members of the module and detect a class that is derived
+        # from the cmflumped.BaseModel
+        for name, obj in vars(module).items():
+            if (
+                    name[0] != '_'
+                    and isinstance(obj, type)
+                    and obj is not module.BaseModel
+                    and issubclass(obj, module.BaseModel)
+            ):
+                return obj
+        # Raise Error if no fitting class is found
+        raise ValueError(f'Module "{path_to_module}" has no class that derives from cmflumped.BaseModel')
@@ -1,13 +1,37 @@
 import spotpy
 import spotpy.describe
+import importlib
 import os
+from logging import getLogger
+logger = getLogger(__name__)
+
 
 def parallel_auto():
     """
-    Returns 'mpi', if this code runs with MPI, else returns 'seq'
+    Returns the parallel mode for spotpy:
+
+    - the value of the environment variable SPOTPY_PARALLEL, if it is set
+    - 'mpi', if this code runs with MPI
+    - else 'seq'
+
+    Multiprocessing is never selected on its own, it is requested with SPOTPY_PARALLEL=mpc
+    or with a number of workers, see sample
     :return:
     """
-    return 'mpi' if 'OMPI_COMM_WORLD_SIZE' in os.environ else 'seq'
+    if 'SPOTPY_PARALLEL' in os.environ:
+        return os.environ['SPOTPY_PARALLEL']
+    elif 'OMPI_COMM_WORLD_SIZE' in os.environ:
+        return 'mpi'
+    else:
+        return 'seq'
+
+
+def is_master():
+    """
+    Returns True, if this process is the master (rank 0) of an MPI run or if this code runs without MPI
+    :return:
+    """
+    return int(os.environ.get('OMPI_COMM_WORLD_RANK', 0)) == 0
 
 
 def get_runs(default=1):
@@ -25,12 +49,120 @@ def get_runs(default=1):
         return default
 
 
-def sample(model, runs, algname='lhs', save_threshold=None, dbformat='hdf5', parallel=None):
+def get_workers(default=None):
+    """
+    Returns the number of worker processes for the sampling
+    :param default: Return this if the environment variable CMFLUMPED_WORKERS is not set
+    :return: int or None
+    """
+    value = os.environ.get('CMFLUMPED_WORKERS', '').strip()
+    if value:
+        try:
+            return int(value)
+        except ValueError:
+            logger.warning(f'Ignoring CMFLUMPED_WORKERS={value!r}, it is not a number of processes')
+    return default
+
+
+def compact_results(filename, tablename):
+    """
+    Rewrites a result table of spotpy with compression and a chunk size for the actual number of runs.
+    spotpy creates the table without knowing the number of runs, which results in small chunks
+    and slow reads of the whole table
+    :param filename: The hdf5 file
+    :param tablename: Name of the table in the root of the file
+    """
+    import tables
+    tmp_filename = filename + '.tmp'
+    with tables.open_file(filename) as src, tables.open_file(tmp_filename, 'w') as dst:
+        table = src.get_node('/', tablename)
+        # The new chunkshape is calculated by PyTables for the number of rows of the table
+        table.copy(dst.root, tablename, chunkshape='auto',
+                   filters=tables.Filters(complevel=5, complib='blosc', shuffle=True))
+    os.replace(tmp_filename, filename)
+
+
+class WorkerSimulation:
+    """
+    The simulate method of a sampler for the mpc and umpc mode of spotpy. spotpy sends
+    the sampler with each run to the workers, including its database, which fails for
+    an open hdf5 file and truncates a csv file. The workers get this sampler without
+    its database, only the master process saves the runs
+    """
+    def __init__(self, sampler):
+        self.sampler = sampler
+
+    def __call__(self, id_params_tuple):
+        return self.sampler.simulate(id_params_tuple)
+
+    def __getstate__(self):
+        state = {}
+        methods = {}
+        for k, v in vars(self.sampler).items():
+            if k in ('datawriter', 'repeat'):
+                continue
+            elif getattr(v, '__self__', None) is self.sampler:
+                # A method of the sampler would carry the whole sampler, it is bound again in the worker
+                methods[k] = v.__name__
+            else:
+                state[k] = v
+        return type(self.sampler), state, methods
+
+    def __setstate__(self, state):
+        cls, sampler_state, methods = state
+        self.sampler = cls.__new__(cls)
+        self.sampler.__dict__.update(sampler_state)
+        for k, name in methods.items():
+            setattr(self.sampler, k, getattr(self.sampler, name))
+
+
+def sample(model, runs, algname='lhs', save_threshold=None, dbformat='hdf5', parallel=None, workers=None):
+    """
+    Samples the model with a spotpy algorithm
+    :param model: The model to sample
+    :param runs: Number of runs, the environment variable SPOTPYRUNS takes precedence
+    :param algname: Name of the spotpy algorithm, eg. mc, lhs, dds
+    :param save_threshold: Only runs with a better objective are saved
+    :param dbformat: spotpy database format
+    :param parallel: spotpy parallel mode (seq, mpc, umpc, mpi), if None, see parallel_auto
+    :param workers: Number of processes for the mpc and umpc mode. If > 1 and no other
+                    parallel mode is given, mpc is used. If None, the environment variable
+                    CMFLUMPED_WORKERS is used
+    """
     runs = get_runs(runs)
+    workers = workers or get_workers()
+    parallel = parallel or parallel_auto()
+    if parallel == 'seq' and workers and workers > 1:
+        parallel = 'mpc'
+    # Printing each time step of each run would dominate the sampling, under mpi all ranks share stdout
+    model.verbose = False
+    multiprocessing = parallel in ('mpc', 'umpc')
+    if multiprocessing:
+        if workers:
+            # spotpy takes the number of processes from a module variable
+            mproc = importlib.import_module('spotpy.parallel.' + parallel[:-2] + 'proc')
+            mproc.process_count = workers
+        # The pool of spotpy starts its workers by spawn on every platform, a forked
+        # process would inherit the state of cmf and the OpenMP runtime. The workers
+        # load the model again from its file, see BaseModel.__reduce__
+        from pathos.helpers import mp
+        start_method = mp.get_start_method(allow_none=True)
+        mp.set_start_method('spawn', force=True)
     alg = getattr(spotpy.algorithms, algname)
-    sampler = alg(
-        model, sim_timeout=600,
-        dbname=str(model), dbformat=dbformat, parallel=parallel or parallel_auto(), save_threshold=save_threshold)
-    print(spotpy.describe.sampler(sampler))
-    print(spotpy.describe.setup(model))
+    try:
+        sampler = alg(
+            model, sim_timeout=600,
+            dbname=str(model), dbformat=dbformat, parallel=parallel, save_threshold=save_threshold)
+    finally:
+        if multiprocessing:
+            mp.set_start_method(start_method, force=True)
+    if multiprocessing:
+        sampler.repeat.process = WorkerSimulation(sampler)
+    if parallel != 'mpi' or is_master():
+        # The workers start waiting for jobs when sampling begins, they would print the same again
+        print(spotpy.describe.sampler(sampler))
+        print(spotpy.describe.setup(model))
     sampler.sample(runs)
+    if dbformat == 'hdf5':
+        # Only the master process returns from sampling, the workers of spotpy's mpi mode exit before
+        compact_results(str(model) + '.h5', str(model))
@@ -15,6 +15,9 @@ from cmflumped.basemodel import BaseParameters, u, BaseModel, DocClass
 from cmflumped.dataprovider import load_csv
 from cmflumped.doctools.result import BaseResult
 
+# The driver and calibration data next to this file
+_data_file = os.path.join(os.path.dirname(__file__), 'glauburg_temp.csv')
+
 
 # The concept class is only used for documentation purposes.
 class Concept:
@@ -83,10 +86,9 @@ class Model1(BaseModel):
     parameters = Parameters()
 
     def __init__(self):
-        path = os.path.dirname(__file__)
         # date,Q,ETpot,P,air_temp_proxy,soil_temperature_5cm
-        data = load_csv(os.path.join(path, 'glauburg_temp.csv'),
-                        date=0, P=2, E=1, Tmin=3, Q=0)
+        data = load_csv(_data_file,
+                        date=0, P=2, E=1, Tmin=3, Q=0, date_format='%Y-%m-%d')
         
         # Call BaseModel.__init__, which does the following
         #   self.project = cmf.project
@@ -107,27 +109,6 @@ class Model1(BaseModel):
         # Make an outlet
         self.outlet = self.project.NewOutlet('outlet', 2, 0, -1)
 
-    def create_result_structure(self):
-        """
-        Creates the container to store the results in.
-
-        Called, when the run time loop starts
-        """
-        outflow = cmf.timeseries(self.data.begin, cmf.day)
-        outflow.add(self.outlet(self.data.begin))
-        return outflow
-
-    def fill_result_structure(self, result, t):
-        """
-        Fills the result structure with data.
-
-        Called in each timestep.
-        """
-        q = self.output(t)
-        result.add(q)
-        if self.verbose:
-            print(f'{t!s:>12s} Q={q:10.5g}mm/day')
-
     def set_soil_capacity(self, p: Parameters)->float:
         """
         Sets the upper soil capacity
@@ -136,22 +117,36 @@ class Model1(BaseModel):
         self.soil.soil.porosity = p.soil_capacity / (1000 * self.soil.thickness)
         # Set initial value
         self.soil.volume = 0.5 * p.soil_capacity
-        # Just a shortcut for the next connections
-        return self.soil.get_capacity()
+        # Just a shortcut for the next connections, kept for the initial values of each run
+        self._capacity = self.soil.get_capacity()
+        return self._capacity
 
     def create_connections(self, p: Parameters):
         """
-        Creates the connections and parameterizes the storages of the model
+        Creates the connections of the model.
+
+        Called from model initialization (self.__init__). The connections
+        are kept, new parameters are set by set_parameters
         """
         # Infiltration
-        cmf.SimpleInfiltration(self.soil, self.cell.surfacewater, W0=p.infiltration_w0)
+        self.infiltration = cmf.SimpleInfiltration(self.soil, self.cell.surfacewater)
         # Route infiltration / saturation excess to outlet
         cmf.waterbalance_connection(self.cell.surfacewater, self.outlet)
 
-        capacity = self.set_soil_capacity(p)
-
         cmf.timeseriesETpot(self.soil, self.cell.transpiration, self.data.ETpot)
 
+        self.set_parameters(p)
+
+    def set_parameters(self, p: Parameters):
+        """
+        Parameterizes the connections and storages of the model.
+
+        Called before a run with a new parameter set
+        """
+        self.infiltration.W0 = p.infiltration_w0
+
+        capacity = self.set_soil_capacity(p)
+
         # Parameterize infiltration capacity
         self.soil.soil.Ksat = p.infiltration_capacity / 1000
 
@@ -168,7 +163,7 @@ class Model1(BaseModel):
         :return: None
         """
 
-        self.soil.volume = self.soil.get_capacity() * 0.5
+        self.soil.volume = self._capacity * 0.5
 
     def output(self, t):
         """
@@ -16,6 +16,9 @@ from cmflumped.basemodel import BaseParameters, u, BaseModel
 from cmflumped.dataprovider import load_csv
 from cmflumped.doctools.result import BaseResult
 
+# The driver and calibration data next to this file
+_data_file = os.path.join(os.path.dirname(__file__), 'glauburg_temp.csv')
+
 
 class Concept:
     """
@@ -112,9 +115,8 @@ class Model2(BaseModel):
     parameters = Parameters()
 
     def __init__(self):
-        path = os.path.dirname(__file__)
-        data = load_csv(os.path.join(path, 'glauburg_temp.csv'),
-                        date=0, P=2, E=1, Tmin=3, Q=0)
+        data = load_csv(_data_file,
+                        date=0, P=2, E=1, Tmin=3, Q=0, date_format='%Y-%m-%d')
         super().__init__( data)
 
     def create_nodes(self):
@@ -135,17 +137,6 @@ class Model2(BaseModel):
         # Make an outlet
         self.outlet = self.project.NewOutlet('outlet', 2, 0, -1)
 
-    def create_result_structure(self):
-        outflow = cmf.timeseries(self.data.begin, cmf.day)
-        outflow.add(self.outlet(self.data.begin))
-        return outflow
-
-    def fill_result_structure(self, result, t):
-        q = self.output(t)
-        result.add(q)
-        if self.verbose:
-            print(f'{t!s:>12s} Q={q:10.5g}mm/day')
-
     def create_snow_connections(self, p: Parameters):
         """
         Divides snowfall and rainfall based on temperature
@@ -156,8 +147,8 @@ class Model2(BaseModel):
 
         cmf.Snowfall(self.cell.snow, self.cell)
         cmf.Rainfall(self.cell.surfacewater, self.cell)
-        cmf.SimpleTindexSnowMelt(self.cell.snow, self.cell.surfacewater,
-                                 self.cell, rate=p.snow_melt_rate)
+        self.snow_melt = cmf.SimpleTindexSnowMelt(self.cell.snow, self.cell.surfacewater,
+                                                  self.cell, rate=p.snow_melt_rate)
 
     def create_surface_runoff(self, p: Parameters):
         """
@@ -165,7 +156,7 @@ class Model2(BaseModel):
         and routes all runoff directly without timelag to the outlet
         """
         # Infiltration
-        cmf.ConceptualInfiltration(self.soil, self.cell.surfacewater, W0=p.infiltration_w0)
+        self.infiltration = cmf.ConceptualInfiltration(self.soil, self.cell.surfacewater, W0=p.infiltration_w0)
         # Route infiltration / saturation excess to outlet
         cmf.waterbalance_connection(self.cell.surfacewater, self.outlet)
 
@@ -177,62 +168,82 @@ class Model2(BaseModel):
         self.soil.soil.porosity = p.soil_capacity / (1000 * self.soil.thickness)
         # Set initial value
         self.soil.volume = 0.5 * p.soil_capacity
-        # Just a shortcut for the next connections
-        return self.soil.get_capacity()
+        # Just a shortcut for the next connections, kept for the initial values of each run
+        self._capacity = self.soil.get_capacity()
+        return self._capacity
 
     def create_canopy_connections(self, p: Parameters):
         """
-        Connects the canopy with the rainfall and the surface
-        depending on vegetation parameters
+        Connects the canopy with the rainfall and the surface.
+        The vegetation parameters are set by set_parameters
         """
         cmf.CanopyStorageEvaporation(self.cell.canopy, self.cell.evaporation, self.cell)
         cmf.RutterInterception(self.cell.canopy, self.cell.surfacewater, self.cell)
         cmf.Rainfall(self.cell.surfacewater, self.cell, True, False)
         cmf.Rainfall(self.cell.canopy, self.cell, False, True)
-        self.cell.vegetation.LAI = p.LAI
-        self.cell.vegetation.CanopyClosure = p.canopy_closure
 
     def create_connections(self, p: Parameters):
         """
-        Creates the connections and parameterizes the storages of the model
-
+        Creates the connections of the model once. The connections depending
+        on parameters are kept and parameterized by set_parameters
         """
 
         # Route snow melt to surface
         if self.cell.snow:
             self.create_snow_connections(p)
         self.create_surface_runoff(p)
-        C = self.set_soil_capacity(p)
 
         cmf.timeseriesETpot(self.soil, self.cell.transpiration, self.data.ETpot)
-        # Parameterize water stress function
-
-        self.soil.soil.Ksat = p.infiltration_capacity / 1000
-
-        self.cell.set_uptakestress(cmf.VolumeStress(
-            p.ETV1 * C, 0)
-        )
+        # Water stress function, the volumes are set by set_parameters
+        self.uptake_stress = cmf.VolumeStress(1, 0)
 
         if self.cell.canopy:
             self.create_canopy_connections(p)
 
-        # Route water from soil to gw
-        cmf.PowerLawConnection(
+        # Route water from soil to gw, V0 and the residual depend on the soil capacity
+        self.percolation = cmf.PowerLawConnection(
             self.soil, self.gw,
             Q0=p.percolation_Q0,
-            V0=p.percolation_V0 * C,
+            V0=p.percolation_V0,
             beta=p.percolation_beta,
-            residual=p.percolation_Vres * C,
         )
         # Route water from gw to outlet
-        cmf.LinearStorageConnection(
+        self.gw_runoff = cmf.LinearStorageConnection(
             self.gw, self.outlet,
             residencetime=p.groundwater_residence_time,
             residual=0
         )
+        self.set_parameters(p)
+
+    def set_parameters(self, p: Parameters):
+        """
+        Parameterizes the connections and storages of the model for a new parameter set
+        """
+        if self.cell.snow:
+            self.snow_melt.SnowMeltRate = p.snow_melt_rate
+
+        self.infiltration.W0 = p.infiltration_w0
+        C = self.set_soil_capacity(p)
+
+        self.soil.soil.Ksat = p.infiltration_capacity / 1000
+
+        # Parameterize water stress function, the cell copies it to the layers
+        self.uptake_stress.V1 = p.ETV1 * C
+        self.cell.set_uptakestress(self.uptake_stress)
+
+        if self.cell.canopy:
+            self.cell.vegetation.LAI = p.LAI
+            self.cell.vegetation.CanopyClosure = p.canopy_closure
+
+        self.percolation.Q0 = p.percolation_Q0
+        self.percolation.V0 = p.percolation_V0 * C
+        self.percolation.beta = p.percolation_beta
+        self.percolation.residual = p.percolation_Vres * C
+
+        self.gw_runoff.residencetime = p.groundwater_residence_time
 
     def initial_values(self, p: Parameters = None):
-        self.soil.volume = self.soil.get_capacity() * p.percolation_V0
+        self.soil.volume = self._capacity * p.percolation_V0
         self.gw.volume = 1.0
         self.cell.snow.volume = 0.0
 
@@ -13,6 +13,9 @@ from cmflumped.basemodel import BaseParameters, u, BaseModel, constant, DocClass
 from cmflumped.dataprovider import load_csv
 from cmflumped.doctools.result import BaseResult
 
+# The driver and calibration data next to this file
+_data_file = os.path.join(os.path.dirname(__file__), 'glauburg_temp.csv')
+
 
 class Concept(DocClass):
     """
@@ -101,9 +104,8 @@ class Model3(BaseModel):
     parameters = Parameters()
 
     def __init__(self, name: str = None):
-        path = os.path.dirname(__file__)
-        data = load_csv(os.path.join(path, 'glauburg_temp.csv'),
-                        date=0, P=2, E=1, Tmin=3, Q=0)
+        data = load_csv(_data_file,
+                        date=0, P=2, E=1, Tmin=3, Q=0, date_format='%Y-%m-%d')
         super().__init__(data, name)
 
     def create_nodes(self):
@@ -122,17 +124,6 @@ class Model3(BaseModel):
         # Make an outlet
         self.outlet = self.project.NewOutlet('outlet', 2, 0, -1)
 
-    def create_result_structure(self):
-        outflow = cmf.timeseries(self.data.begin, cmf.day)
-        outflow.add(self.outlet(self.data.begin))
-        return outflow
-
-    def fill_result_structure(self, result, t):
-        q = self.output(t)
-        result.add(q)
-        if self.verbose:
-            print(f'{t!s:>12s} Q={q:10.5g}mm/day')
-
     def create_snow_connections(self, p: Parameters):
         """
         Divides snowfall and rainfall based on temperature
@@ -143,8 +134,8 @@ class Model3(BaseModel):
 
         cmf.Snowfall(self.cell.snow, self.cell)
         cmf.Rainfall(self.cell.surfacewater, self.cell)
-        cmf.SimpleTindexSnowMelt(self.cell.snow, self.cell.surfacewater,
-                                 self.cell, rate=p.snow_melt_rate)
+        self.snow_melt = cmf.SimpleTindexSnowMelt(self.cell.snow, self.cell.surfacewater,
+                                                  self.cell, rate=p.snow_melt_rate)
 
     def create_surface_runoff(self, p: Parameters):
         """
@@ -152,7 +143,7 @@ class Model3(BaseModel):
         and routes all runoff directly without timelag to the outlet
         """
         # Infiltration
-        cmf.ConceptualInfiltration(self.soil, self.cell.surfacewater, W0=p.infiltration_w0)
+        self.infiltration = cmf.ConceptualInfiltration(self.soil, self.cell.surfacewater, W0=p.infiltration_w0)
         # Route infiltration / saturation excess to outlet
         cmf.waterbalance_connection(self.cell.surfacewater, self.outlet)
 
@@ -164,12 +155,14 @@ class Model3(BaseModel):
         self.soil.soil.porosity = p.soil_capacity / (1000 * self.soil.thickness)
         # Set initial value
         self.soil.volume = 0.5 * p.soil_capacity
-        # Just a shortcut for the next connections
-        return self.soil.get_capacity()
+        # Just a shortcut for the next connections, kept for the initial values of each run
+        self._capacity = self.soil.get_capacity()
+        return self._capacity
 
     def create_connections(self, p: Parameters):
         """
-        Creates the connections and parameterizes the storages of the model
+        Creates the connections of the model once. The connections depending
+        on parameters are kept and parameterized by set_parameters
         """
 
         # Route snow melt to surface
@@ -177,34 +170,54 @@ class Model3(BaseModel):
             self.create_snow_connections(p)
 
         self.create_surface_runoff(p)
-        C = self.set_soil_capacity(p)
 
         cmf.timeseriesETpot(self.soil, self.cell.transpiration, self.data.ETpot)
 
-        # Parameterize water stress function
-        self.soil.soil.Ksat = p.infiltration_capacity / 1000
+        # Water stress function, the volumes are set by set_parameters
+        self.uptake_stress = cmf.VolumeStress(1, 0)
 
-        self.cell.set_uptakestress(cmf.VolumeStress(
-            p.ETV1 * C, 0)
-        )
         # Percolation
-        cmf.ConstantFlux(self.soil, self.gw, p.perc_rate, 0, cmf.week)
+        self.percolation = cmf.ConstantFlux(self.soil, self.gw, p.perc_rate, 0, cmf.week)
 
         # GW to outlet
-        cmf.LinearStorageConnection(self.gw, self.outlet, p.gw_residence_time)
-
+        self.gw_runoff = cmf.LinearStorageConnection(self.gw, self.outlet, p.gw_residence_time)
 
-        # Interflow
-        cmf.PowerLawConnection(
+        # Interflow, V0 and the residual depend on the soil capacity
+        self.interflow = cmf.PowerLawConnection(
             self.soil, self.outlet,
             Q0=p.Q0,
-            V0=p.V0 * C,
+            V0=p.V0,
             beta=p.beta,
-            residual=p.Vres * C,
         )
+        self.set_parameters(p)
+
+    def set_parameters(self, p: Parameters):
+        """
+        Parameterizes the connections and storages of the model for a new parameter set
+        """
+        if self.cell.snow:
+            self.snow_melt.SnowMeltRate = p.snow_melt_rate
+
+        self.infiltration.W0 = p.infiltration_w0
+        C = self.set_soil_capacity(p)
+
+        self.soil.soil.Ksat = p.infiltration_capacity / 1000
+
+        # Parameterize water stress function, the cell copies it to the layers
+        self.uptake_stress.V1 = p.ETV1 * C
+        self.cell.set_uptakestress(self.uptake_stress)
+
+        self.percolation.MaxFlux = p.perc_rate
+
+        self.gw_runoff.residencetime = p.gw_residence_time
+
+        self.interflow.Q0 = p.Q0
+        self.interflow.V0 = p.V0 * C
+        self.interflow.beta = p.beta
+        self.interflow.residual = p.Vres * C
 
     def initial_values(self, p: Parameters = None):
-        self.soil.volume = self.soil.get_capacity() * p.V0
+        self.soil.volume = self._capacity * p.V0
         self.gw.volume = 0.1 * p.gw_residence_time
         self.cell.snow.volume = 0.0
 
@@ -282,8 +295,7 @@ if __name__ == '__main__':
     # cmd.run(__file__, runs=1000, sampler='lhs')
     from cmflumped.__main__ import main
     import sys
-    sys.argv.insert(2, __file__)
-    main()
+    main(sys.argv[1:2] + [__file__] + sys.argv[2:])
 
 
 
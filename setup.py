@@ -39,9 +39,17 @@ setuptools.setup(
     ],
     python_requires='>=3.6',
     install_requires=requirements,
+    # Only needed by some commands: doc builds the documentation, gui shows the fluxogram.
+    # PyTables stays required, run writes hdf5 by default and the example results read it
+    extras_require={
+        'doc': ['sphinx>=4.0.0'],
+        'gui': ['networkx>=2.4'],
+        'io': ['openpyxl>=3.0.0'],
+    },
     entry_points = {
         'console_scripts': [
-            'cmf.lumped=cmflumped.__main__:main'
+            'cmf.lumped=cmflumped.__main__:main',
+            'cmflumped=cmflumped.__main__:main',
         ]
     }
 )
\ No newline at end of file